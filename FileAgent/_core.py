@@ -0,0 +1,478 @@
+"""
+Shared watcher machinery used by file_watcher.py, file_watcher_agent.py and file_watcher_local.py.
+
+Each script only decides where a ready file should go; debouncing, readiness checks,
+collision-safe moves, retries and the JSONL audit log all live here.
+"""
+import time
+import orjson
+import atexit
+from pathlib import Path
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+import shutil
+import threading
+import heapq
+import os
+import sys
+import re
+import errno
+import logging
+import logging.handlers
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Shared configuration ---
+LOG_FILE = Path(__file__).with_name("file_watcher_log.jsonl")  # JSONL audit log next to the scripts
+LOG_ECHO = os.environ.get("FILE_AGENT_ECHO", "1") != "0"  # set FILE_AGENT_ECHO=0 to stop printing each record
+logger = logging.getLogger("file_agent")  # all console output: status lines and record echoes (see start_console_log)
+WATCH_EXTENSIONS = {".txt", ".md", ".csv", ".log", ".pdf"}  # set to None to watch everything
+# Same set, in the form str.endswith takes; ("",) matches every path when watching everything.
+WATCH_EXTENSIONS_TUPLE = tuple(WATCH_EXTENSIONS) if WATCH_EXTENSIONS is not None else ("",)
+
+# Extension-based routing (scripts may route some extensions by content instead).
+ORGANIZE_MAP = {
+    ".pdf": "PDFs",
+    ".txt": "Docs",
+    ".md": "Docs",
+    ".csv": "Data",
+    ".log": "Logs",
+}
+
+# Most mapped extensions are 4 characters (".pdf", ".txt", ...), so the last 4 characters of
+# the raw path string are tried first; only other lengths (".md") need the suffix split.
+ORGANIZE_TAIL_MAP = {ext: folder for ext, folder in ORGANIZE_MAP.items() if len(ext) == 4}
+PATH_SEPARATORS = os.sep + (os.altsep or "")
+
+def organize_folder(src_path: str):
+    """ORGANIZE_MAP folder for a path string, or None if its extension isn't mapped."""
+    folder = ORGANIZE_TAIL_MAP.get(src_path[-4:].lower())
+    if folder is not None:
+        # A file named just ".pdf" is a dotfile with no extension (as with Path.suffix).
+        return None if src_path[-5:-4] in PATH_SEPARATORS else folder
+    return ORGANIZE_MAP.get(os.path.splitext(src_path)[1].lower())
+
+def is_bare_dotfile(sp: str) -> bool:
+    """
+    True for a watched-extension match that is really a dotfile named just ".pdf" etc.
+    (Path.suffix is "" for those, so they were never watched). Only called on paths that
+    already passed the endswith filter, and always False when everything is watched.
+    """
+    i = sp.rfind(".")
+    return WATCH_EXTENSIONS is not None and (i == 0 or sp[i - 1] in PATH_SEPARATORS)
+
+# --- Event storm protection ---
+DEBOUNCE_SECONDS = 0.5
+DEBOUNCE_NS = int(DEBOUNCE_SECONDS * 1e9)
+LAST_HANDLED_MAX = 4096  # oldest entries are evicted beyond this (keeps long runs bounded)
+RETRY_WORKERS = 8  # busy files whose readiness waits can run at the same time
+
+# --- Audit log ---
+log_fh = None  # buffered append handle, opened once by open_log()
+LOG_FLUSH_SECONDS = 1.0  # how far the file on disk may lag behind (tail -f, crashes, closed console)
+ts_cache = (0, "")  # (epoch second, formatted timestamp) reused within the same second
+
+def open_log():
+    """
+    Create LOG_FILE's folder and open the shared append handle.
+    A daemon thread flushes it every LOG_FLUSH_SECONDS, and it is closed (flushed) on exit.
+    """
+    global log_fh
+    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    log_fh = open(LOG_FILE, "ab", buffering=1 << 16)
+    atexit.register(log_fh.close)
+    threading.Thread(target=flush_log_forever, daemon=True).start()
+
+def flush_log_forever():
+    """Push buffered records to disk once per LOG_FLUSH_SECONDS (a no-op when nothing is pending)."""
+    while True:
+        time.sleep(LOG_FLUSH_SECONDS)
+        try:
+            log_fh.flush()
+        except ValueError:  # closed by the atexit hook during shutdown
+            return
+
+def start_console_log():
+    """
+    Write logger's messages to stdout from a background QueueListener thread, so event
+    threads only enqueue and never wait on the console. Everything goes through the one
+    queue, so status lines and record echoes print in the order they happened.
+    (QueueHandler still formats each message on the calling thread.)
+    """
+    q = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(q))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(q, logging.StreamHandler(sys.stdout))
+    listener.start()
+    atexit.register(listener.stop)
+
+def timestamp() -> str:
+    """Second-granularity timestamp; strftime runs at most once per second."""
+    global ts_cache
+    now = int(time.time())
+    sec, text = ts_cache
+    if now != sec:
+        text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        ts_cache = (now, text)
+    return text
+
+def log_event(event_type: str, path: Path, **extra):
+    """
+    Append a JSON line to LOG_FILE for auditing/debugging.
+    Extra keyword args get included (e.g., summary=..., error=...).
+    """
+    record = {
+        "ts": timestamp(),
+        "event": event_type,
+        "path": str(path),
+        **extra
+    }
+    log_fh.write(orjson.dumps(record) + b"\n")
+    if __debug__:  # compiled out under python -O
+        if LOG_ECHO:
+            logger.info("%s", record)
+
+# --- Text previews ---
+# Preview reads are rounded up to whole pages (4 KiB on Unix, 8 KiB on Windows).
+PREVIEW_BLOCK = 8192 if sys.platform == "win32" else 4096
+
+def read_text_preview(path, max_chars: int = 1200) -> str:
+    """
+    Read a small slice of a text file (protects against huge files / encoding issues).
+    Only the first max_chars*4 bytes (worst-case UTF-8) are read, whatever the file size.
+    Newlines are normalized to "\n" like Path.read_text does, so Windows files give the same
+    text (and route cache key) as Unix ones and "\r" doesn't eat into max_chars.
+    """
+    nbytes = -(-max_chars * 4 // PREVIEW_BLOCK) * PREVIEW_BLOCK
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            buf = os.read(fd, nbytes)
+        finally:
+            os.close(fd)
+    except OSError:
+        return ""
+    text = buf.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+    return text[:max_chars]
+
+# --- File readiness ---
+if sys.platform == "win32":
+    import ctypes
+    from ctypes import wintypes
+
+    _kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    _kernel32.CreateFileW.argtypes = [
+        wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD, wintypes.LPVOID,
+        wintypes.DWORD, wintypes.DWORD, wintypes.HANDLE,
+    ]
+    _kernel32.CreateFileW.restype = wintypes.HANDLE
+    _kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+    _INVALID_HANDLE_VALUE = wintypes.HANDLE(-1).value
+
+    def is_locked(path: Path) -> bool:
+        """
+        Probe for a writer's exclusive lock without taking one ourselves:
+        GENERIC_READ with FILE_SHARE_READ|WRITE|DELETE, OPEN_EXISTING.
+        """
+        handle = _kernel32.CreateFileW(str(path), 0x80000000, 7, None, 3, 0x80, None)
+        if handle == _INVALID_HANDLE_VALUE:
+            return True
+        _kernel32.CloseHandle(handle)
+        return False
+else:
+    def is_locked(path: Path) -> bool:
+        """POSIX has no mandatory share locks; size/mtime stability is the only signal."""
+        return False
+
+def wait_until_ready(path: Path, attempts: int = 40, delay: float = 0.1, initial_stat=None) -> bool:
+    """
+    Windows can hold files open right after creation/download.
+    This waits until the file is unlocked and its size/mtime stabilize to avoid WinError 32.
+    initial_stat (an os.stat result the caller already has) stands in for the first stat call.
+    """
+    last = None
+    st = initial_stat
+    for _ in range(attempts):
+        if st is None:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                return False
+
+        # Wait for size/mtime to stop changing (helps for downloads/editor writes).
+        if not is_locked(path):
+            sig = (st.st_size, st.st_mtime_ns)
+            if sig == last:
+                return True
+            last = sig
+
+        st = None
+        time.sleep(delay)
+
+    return False
+
+# --- Moves ---
+if sys.platform == "win32":
+    # MoveFileExW without MOVEFILE_REPLACE_EXISTING: already refuses to overwrite, atomically.
+    rename_noreplace = os.rename
+else:
+    import ctypes
+
+    _AT_FDCWD = -100
+    _RENAME_NOREPLACE = 1
+    # renameat2 (Linux 3.15+, glibc 2.28+); missing elsewhere, e.g. macOS.
+    _renameat2 = getattr(ctypes.CDLL(None, use_errno=True), "renameat2", None)
+
+    def rename_noreplace(src: str, dest: str):
+        """
+        Rename src to dest, raising FileExistsError instead of overwriting dest.
+        With renameat2(RENAME_NOREPLACE) the existence check and the rename are one atomic
+        syscall; otherwise check first, then os.replace (leaves a small race window).
+        """
+        if _renameat2 is not None:
+            if _renameat2(_AT_FDCWD, os.fsencode(src), _AT_FDCWD, os.fsencode(dest), _RENAME_NOREPLACE) == 0:
+                return
+            err = ctypes.get_errno()
+            # EINVAL: this filesystem doesn't support the flag; ENOSYS: kernel too old.
+            if err not in (errno.EINVAL, errno.ENOSYS):
+                raise OSError(err, os.strerror(err), os.fspath(src), None, os.fspath(dest))
+
+        if os.path.lexists(dest):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), os.fspath(dest))
+        os.replace(src, dest)
+
+def next_free_name(name: str, dest_dir: str) -> str:
+    """
+    Collision path for a file called name inside dest_dir: "stem (N+1).suf", where N is
+    the highest existing suffix (found with a single directory scan).
+    """
+    stem, suf = os.path.splitext(name)
+    # Case-insensitive so "Notes (1).txt" counts for "notes.txt" on Windows.
+    pat = re.compile(re.escape(stem) + r" \((\d+)\)" + re.escape(suf) + "$", re.IGNORECASE)
+    with os.scandir(dest_dir) as entries:
+        nums = [int(m.group(1)) for e in entries if (m := pat.match(e.name))]
+    return os.path.join(dest_dir, f"{stem} ({max(nums, default=0) + 1}){suf}")
+
+def move_safely(src, dest_dir) -> str:
+    """
+    Move a file into dest_dir (both str or Path); returns the final path as a str.
+    If a file with the same name already exists there, auto-rename with (N+1) (see next_free_name).
+    Same-volume moves are a single no-replace rename; only cross-volume moves copy+delete.
+    Works on plain strings throughout, so no Path objects are built per move.
+    """
+    src, dest_dir = os.fspath(src), os.fspath(dest_dir)
+    os.makedirs(dest_dir, exist_ok=True)
+    name = os.path.basename(src)
+    dest = os.path.join(dest_dir, name)
+
+    while True:
+        try:
+            rename_noreplace(src, dest)
+            return dest
+        except FileExistsError:
+            # Name taken (possibly by a file that appeared a moment ago): pick the next free one.
+            dest = next_free_name(name, dest_dir)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            if os.path.exists(dest):
+                dest = next_free_name(name, dest_dir)
+            shutil.move(src, dest)
+            return dest
+
+class Watcher:
+    """
+    Watches watch_dir and moves files dropped into its root into subfolders.
+    The base class routes by extension (ORGANIZE_MAP); scripts subclass it and
+    override handle_ready() to route some files by content instead.
+    """
+    def __init__(self, watch_dir: Path):
+        self.watch_dir = watch_dir
+        self.watch_dir_str = os.fspath(watch_dir)
+        self.watch_dir_key = os.path.normcase(self.watch_dir_str)  # compared against event parents
+
+        # maps (st_dev, st_ino) and path str -> (time.monotonic_ns() last handled, path str), oldest first
+        self.last_handled = OrderedDict()
+        self.last_handled_lock = threading.Lock()  # on_trigger runs on both the observer and retry threads
+
+        self.retry_queue = []  # heap of (due monotonic time, path) waiting to be retried
+        self.retry_cond = threading.Condition()
+        # Due retries run here, so one slow wait_until_ready doesn't hold up the rest of the heap.
+        self.retry_pool = ThreadPoolExecutor(max_workers=RETRY_WORKERS, thread_name_prefix="retry")
+
+    def retry_later(self, path: Path, seconds: float = 1.0):
+        """If a file is still being written/locked, schedule a retry after a short delay."""
+        with self.retry_cond:
+            heapq.heappush(self.retry_queue, (time.monotonic() + seconds, path))
+            self.retry_cond.notify()
+
+    def retry_worker(self):
+        """Single daemon thread that hands every scheduled retry to retry_pool once it comes due."""
+        while True:
+            with self.retry_cond:
+                while not self.retry_queue or self.retry_queue[0][0] > time.monotonic():
+                    timeout = self.retry_queue[0][0] - time.monotonic() if self.retry_queue else None
+                    self.retry_cond.wait(timeout)
+                _, path = heapq.heappop(self.retry_queue)
+            if path.exists():  # still there
+                self.retry_pool.submit(self.on_trigger, "retry", path)
+
+    def handle_ready(self, path: Path, folder_name: str):
+        """Route a file that is done being written: move it to its ORGANIZE_MAP folder."""
+        new_path = move_safely(path, os.path.join(self.watch_dir_str, folder_name))
+
+        logger.info("📂 Moved %s → %s/", path.name, folder_name)
+        log_event("organized", new_path)
+
+    def organize_file(self, path: Path, st=None):
+        """
+        Main "act" step:
+        - Only processes files that are directly inside watch_dir (not nested folders).
+        - Waits for the file to be unlocked/stable (retrying later if it isn't).
+        - Hands the ready file to handle_ready().
+        st is the file's os.stat result if the caller already took one.
+        """
+        sp = os.fspath(path)
+
+        # Only act on files in the root of watch_dir (prevents re-processing moved files).
+        if os.path.normcase(os.path.dirname(sp)) != self.watch_dir_key:
+            return
+
+        folder_name = organize_folder(sp)
+        if folder_name is None:
+            return
+
+        # Avoid classifying/moving files still being written/locked.
+        if not wait_until_ready(path, initial_stat=st):
+            logger.warning("⚠️ File still busy/locked: %s (will retry)", path.name)
+            log_event("busy_retry", path)
+            self.retry_later(path, 1.0)
+            return
+
+        self.handle_ready(path, folder_name)
+
+    def on_trigger(self, event_type: str, path: Path):
+        """
+        Debounced entrypoint called by watchdog events.
+        Only triggers actions for a subset of event types.
+        """
+        now = time.monotonic_ns()
+        sp = os.fspath(path)
+        acts = event_type in {"created", "moved", "retry"}
+
+        # Coalesce rapid repeats for the same path (common with editor saves/downloads)
+        # before paying for any syscall.
+        with self.last_handled_lock:
+            last = self.last_handled.get(sp)
+            if last is not None and now - last[0] < DEBOUNCE_NS:
+                return
+
+        # Only events that can move the file are stat'ed. They are keyed by file identity too,
+        # so our own move of a file we just handled hits the same entry; the path key still
+        # covers everything else. This stat is reused as the first readiness check in organize_file.
+        st = None
+        keys = (sp,)
+        extra = {}
+        if acts:
+            try:
+                st = os.stat(sp)
+                extra = {"inode": st.st_ino}
+                # st_ino is 0 when Windows falls back to directory info and on some network
+                # shares; unrelated files would share that key.
+                if st.st_ino:
+                    keys = ((st.st_dev, st.st_ino), sp)
+            except OSError:
+                pass
+
+        with self.last_handled_lock:
+            for key in keys:
+                last = self.last_handled.get(key)
+                if last is None or now - last[0] >= DEBOUNCE_NS:
+                    continue
+                # Same path: checked again here, another thread may have handled it meanwhile.
+                # A different path only counts as a repeat for a "moved" out of the inbox root
+                # (our own move into a subfolder). A rename within the root is a new name still
+                # to organize (the earlier event may have failed on the old name), and anything
+                # else is a new file that happens to reuse a freed inode.
+                if last[1] == sp or (
+                    event_type == "moved" and os.path.normcase(os.path.dirname(sp)) != self.watch_dir_key
+                ):
+                    return
+
+            for key in keys:
+                self.last_handled[key] = (now, sp)
+                self.last_handled.move_to_end(key)
+            while len(self.last_handled) > LAST_HANDLED_MAX:
+                self.last_handled.popitem(last=False)
+
+        log_event(event_type, path, **extra)
+
+        try:
+            if acts:
+                self.organize_file(path, st)
+        except Exception as e:
+            # Protect the observer thread from crashing on unexpected exceptions.
+            logger.error("❌ Action failed for %s: %s", path, e)
+            log_event("action_error", path)
+
+    def run(self):
+        """Bootstraps the watchdog observer and keeps the process alive until Ctrl+C."""
+        if not self.watch_dir.exists():
+            raise FileNotFoundError(f"WATCH_DIR does not exist: {self.watch_dir}")
+
+        open_log()
+        start_console_log()
+
+        observer = Observer()
+        observer.schedule(Handler(self), str(self.watch_dir), recursive=True)
+        observer.start()
+        threading.Thread(target=self.retry_worker, daemon=True).start()
+
+        logger.info("Watching: %s (recursive=True)", self.watch_dir)
+        logger.info("Press Ctrl+C to stop.")
+
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            observer.stop()
+
+        observer.join()
+
+class Handler(FileSystemEventHandler):
+    """
+    Watchdog handler that converts filesystem events into the watcher's on_trigger() calls.
+    Directories and unwatched extensions are rejected on the raw path string, before any Path
+    is built (editor swap files, .tmp downloads and the like are most of the events).
+    Bare dotfiles such as ".pdf" are rejected too, since they have no extension.
+    """
+    def __init__(self, watcher: Watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        sp = event.src_path
+        if event.is_directory or not sp.lower().endswith(WATCH_EXTENSIONS_TUPLE) or is_bare_dotfile(sp):
+            return
+        self.watcher.on_trigger("created", Path(sp))
+
+    def on_modified(self, event):
+        sp = event.src_path
+        if event.is_directory or not sp.lower().endswith(WATCH_EXTENSIONS_TUPLE) or is_bare_dotfile(sp):
+            return
+        self.watcher.on_trigger("modified", Path(sp))
+
+    def on_moved(self, event):
+        sp = event.dest_path
+        if event.is_directory or not sp.lower().endswith(WATCH_EXTENSIONS_TUPLE) or is_bare_dotfile(sp):
+            return
+        self.watcher.on_trigger("moved", Path(sp))
+
+    def on_deleted(self, event):
+        sp = event.src_path
+        if event.is_directory or not sp.lower().endswith(WATCH_EXTENSIONS_TUPLE) or is_bare_dotfile(sp):
+            return
+        self.watcher.on_trigger("deleted", Path(sp))
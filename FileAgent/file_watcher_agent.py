@@ -1,24 +1,59 @@
-import time
-import json
 from pathlib import Path
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
-import shutil
+import asyncio
 import threading
 import os
-from openai import OpenAI
+import hashlib
+import sqlite3
+import httpx
+from openai import AsyncOpenAI
+
+from _core import LOG_FILE, Watcher, log_event, logger, move_safely, read_text_preview
 
 # --- OpenAI client / routing configuration ---
 # Expects OPENAI_API_KEY to be set in your environment (setx OPENAI_API_KEY "...").
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# Async client over HTTP/2: concurrent requests share one TCP+TLS connection as multiplexed streams.
+client = AsyncOpenAI(
+    api_key=os.environ.get("OPENAI_API_KEY"),
+    http_client=httpx.AsyncClient(http2=True, limits=httpx.Limits(max_connections=16)),
+)
+
+# Event loop for all OpenAI calls, run forever on its own daemon thread (started by AgentWatcher.run).
+# Watchdog threads submit work with asyncio.run_coroutine_threadsafe and return immediately.
+loop = asyncio.new_event_loop()
+
+# Model used for routing (part of the route cache key with the prompt, so upgrades start a fresh cache).
+ROUTE_MODEL = "gpt-4.1-mini"
 
 # Allowed routing destinations for TXT classification (returned verbatim by the model).
 ROUTE_FOLDERS = ["School", "Work", "Personal", "Finance", "Other"]
+ROUTE_FOLDER_SET = frozenset(ROUTE_FOLDERS)
+
+# Prompts are built once; only {text} is filled in per call.
+# The filled-in ROUTE_PROMPT is what the route cache hashes, so editing it or ROUTE_FOLDERS
+# also starts a fresh cache.
+# Minimal, strict routing prompt: model must return exactly one folder label.
+ROUTE_PROMPT = f"""
+You are a file organizer. Choose exactly ONE folder for this text from:
+{ROUTE_FOLDERS}
+
+Rules:
+- Return ONLY the folder name (no extra words).
+- If unsure, return "Other".
+
+Text:
+""".lstrip() + "{text}"
+
+SUMMARY_PROMPT = """
+Summarize the text below in:
+- 3 concise bullet points
+- then 3 short tags (single words or short phrases)
+
+Text:
+""".lstrip() + "{text}"
 
 # --- Watcher configuration ---
+# Log file, watched extensions, ORGANIZE_MAP and debounce settings live in _core.py.
 WATCH_DIR = Path(r"C:\Users\danie\Documents\filetest")  # folder being monitored
-LOG_FILE = Path(__file__).with_name("file_watcher_log.jsonl")  # JSONL audit log next to this script
-WATCH_EXTENSIONS = {".txt", ".md", ".csv", ".log", ".pdf"}  # set to None to watch everything
 
 # --- Legacy / leftover mapping structures (not used by the OpenAI routing path below) ---
 TXT_LABELS = {
@@ -38,74 +73,80 @@ TXT_AI_FOLDERS = {
     "misc": "Misc",
 }
 
-# Extension-based routing for non-TXT files.
-ORGANIZE_MAP = {
-    ".pdf": "PDFs",
-    ".txt": "Docs",
-    ".md": "Docs",
-    ".csv": "Data",
-    ".log": "Logs",
+# --- Legacy keyword classifier (not used by the OpenAI routing path below) ---
+# Label -> keywords, in priority order (first label with any hit wins).
+TXT_KEYWORDS = {
+    "school": ["canvas", "assignment", "midterm", "lecture", "homework", "osu", "cse", "ece"],
+    "work": ["meeting", "jira", "ticket", "manager", "deadline", "sprint"],
+    "receipt": ["$","total","subtotal","tax","invoice","order","payment","receipt"],
+    "code": ["def ", "class ", "import ", "{", "}", "function", "SELECT ", "FROM "],
 }
 
-# --- Event storm protection ---
-DEBOUNCE_SECONDS = 0.5
-last_handled = {}  # maps Path -> last timestamp handled (coalesces rapid duplicate events)
-
-def should_watch(path: Path) -> bool:
-    """Filter out directories and extensions you don't care about."""
-    if path.is_dir():
-        return False
-    if WATCH_EXTENSIONS is None:
-        return True
-    return path.suffix.lower() in WATCH_EXTENSIONS
+# Flattened (keyword, label) pairs in priority order. Each check is a str `in`, which
+# CPython runs as a C substring search (memchr for the one-character keywords), and the
+# first hit wins, so no per-label generator or regex backtracking is involved.
+KEYWORD_TABLE = tuple((k, label) for label, keywords in TXT_KEYWORDS.items() for k in keywords)
 
-# --- Legacy keyword classifier (not used by the OpenAI routing path below) ---
 def classify_txt_light(text: str) -> str:
     """Cheap keyword-based classification; kept for fallback/experiments."""
     t = text.lower()
-
-    if any(k in t for k in ["canvas", "assignment", "midterm", "lecture", "homework", "osu", "cse", "ece"]):
-        return "school"
-    if any(k in t for k in ["meeting", "jira", "ticket", "manager", "deadline", "sprint"]):
-        return "work"
-    if any(k in t for k in ["$","total","subtotal","tax","invoice","order","payment","receipt"]):
-        return "receipt"
-    if any(k in t for k in ["def ", "class ", "import ", "{", "}", "function", "SELECT ", "FROM "]):
-        return "code"
-
+    for k, label in KEYWORD_TABLE:
+        if k in t:
+            return label
     return "misc"
 
-def read_text_preview(path: Path, max_chars: int = 1200) -> str:
-    """Read a small slice of a text file (protects against huge files / encoding issues)."""
-    try:
-        return path.read_text(encoding="utf-8", errors="ignore")[:max_chars]
-    except Exception:
-        return ""
-
-def ai_route_txt(path: Path) -> str:
+# --- Route cache ---
+# Identical previews (re-downloads, files moved back into WATCH_DIR) reuse the earlier
+# routing decision instead of another API round-trip. Least recently used rows beyond
+# ROUTE_CACHE_MAX are dropped; hits are re-inserted so their rowid marks them as recent.
+ROUTE_CACHE_FILE = LOG_FILE.with_name("route_cache.sqlite")
+ROUTE_CACHE_MAX = 10_000
+
+route_cache = sqlite3.connect(str(ROUTE_CACHE_FILE), isolation_level=None, check_same_thread=False)
+route_cache.execute("PRAGMA journal_mode=WAL")
+route_cache.execute("PRAGMA synchronous=NORMAL")
+route_cache.execute("CREATE TABLE IF NOT EXISTS r(h BLOB PRIMARY KEY, folder TEXT)")
+route_cache_lock = threading.Lock()  # the connection is shared by the observer and retry threads
+
+def route_cache_key(prompt: str) -> bytes:
+    """Hash of the model name + full routing prompt (ROUTE_PROMPT with the preview text filled in)."""
+    return hashlib.blake2b(f"{ROUTE_MODEL}\0{prompt}".encode("utf-8"), digest_size=16).digest()
+
+def route_cache_get(key: bytes):
+    """Return the cached folder for key (marking it recently used), or None on a miss."""
+    with route_cache_lock:
+        row = route_cache.execute("SELECT folder FROM r WHERE h = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        route_cache.execute("INSERT OR REPLACE INTO r(h, folder) VALUES (?, ?)", (key, row[0]))
+        return row[0]
+
+def route_cache_put(key: bytes, folder: str):
+    """Store a routing decision and trim the cache back to ROUTE_CACHE_MAX rows."""
+    with route_cache_lock:
+        cur = route_cache.execute("INSERT OR REPLACE INTO r(h, folder) VALUES (?, ?)", (key, folder))
+        route_cache.execute("DELETE FROM r WHERE rowid <= ?", (cur.lastrowid - ROUTE_CACHE_MAX,))
+
+async def ai_route_txt(path: Path) -> str:
     """
     Use ChatGPT (via OpenAI API) to classify a TXT file into one of ROUTE_FOLDERS.
     Returns a folder name like: School / Work / Personal / Finance / Other.
+    Decisions are cached by content hash (see route_cache_get / route_cache_put).
     """
     text = read_text_preview(path, max_chars=3000).strip()
     if not text:
         return "Other"
 
-    # Minimal, strict prompt: model must return exactly one folder label.
-    prompt = f"""
-You are a file organizer. Choose exactly ONE folder for this text from:
-{ROUTE_FOLDERS}
-
-Rules:
-- Return ONLY the folder name (no extra words).
-- If unsure, return "Other".
+    prompt = ROUTE_PROMPT.format(text=text)
 
-Text:
-{text}
-""".strip()
+    key = route_cache_key(prompt)
+    cached = route_cache_get(key)
+    # A folder that is no longer allowed counts as a miss (the fresh answer replaces it).
+    if cached in ROUTE_FOLDER_SET:
+        return cached
 
-    resp = client.responses.create(
-        model="gpt-4.1-mini",
+    resp = await client.responses.create(
+        model=ROUTE_MODEL,
         input=prompt,
         temperature=0
     )
@@ -113,82 +154,12 @@ Text:
     folder = resp.output_text.strip()
 
     # Guardrail: if the model returns something unexpected, default to Other.
-    if folder not in ROUTE_FOLDERS:
+    # Not cached, so the same text gets a fresh answer next time.
+    if folder not in ROUTE_FOLDER_SET:
         return "Other"
-    return folder
 
-def retry_later(path: Path, seconds: float = 1.0):
-    """If a file is still being written/locked, retry after a short delay in a daemon thread."""
-    def _job():
-        time.sleep(seconds)
-        if path.exists():  # still there
-            on_trigger("retry", path)
-    threading.Thread(target=_job, daemon=True).start()
-
-def log_event(event_type: str, path: Path, **extra):
-    """
-    Append a JSON line to LOG_FILE for auditing/debugging.
-    Extra keyword args get included (e.g., summary=..., error=...).
-    """
-    record = {
-        "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "event": event_type,
-        "path": str(path),
-        **extra
-    }
-    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with LOG_FILE.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(record) + "\n")
-    print(record)
-
-def wait_until_ready(path: Path, attempts: int = 20, delay: float = 0.25) -> bool:
-    """
-    Windows can hold files open right after creation/download.
-    This waits until the file is readable and its size stabilizes to avoid WinError 32.
-    """
-    last_size = -1
-    for _ in range(attempts):
-        if not path.exists():
-            return False
-
-        try:
-            # Try opening for read to detect locks.
-            with path.open("rb"):
-                pass
-
-            # Wait for size to stop changing (helps for downloads/editor writes).
-            size = path.stat().st_size
-            if size == last_size:
-                return True
-            last_size = size
-
-        except PermissionError:
-            pass
-
-        time.sleep(delay)
-
-    return False
-
-def move_safely(src: Path, dest_dir: Path) -> Path:
-    """
-    Move a file into dest_dir.
-    If a file with the same name already exists there, auto-rename with (1), (2), ...
-    """
-    dest_dir.mkdir(parents=True, exist_ok=True)
-    dest = dest_dir / src.name
-
-    if dest.exists():
-        stem, suf = src.stem, src.suffix
-        i = 1
-        while True:
-            candidate = dest_dir / f"{stem} ({i}){suf}"
-            if not candidate.exists():
-                dest = candidate
-                break
-            i += 1
-
-    shutil.move(str(src), str(dest))
-    return dest
+    route_cache_put(key, folder)
+    return folder
 
 # --- Summarization settings ---
 # If False, summaries only run when the filename contains "@sum".
@@ -198,7 +169,7 @@ def wants_summary(path: Path) -> bool:
     """On-demand trigger: include '@sum' in the filename to request summarization."""
     return "@sum" in path.stem.lower()
 
-def ai_summarize_txt(path: Path) -> str:
+async def ai_summarize_txt(path) -> str:
     """
     Use ChatGPT (via OpenAI API) to generate a short overview of a TXT file:
     - 3 bullets + 3 tags.
@@ -207,16 +178,9 @@ def ai_summarize_txt(path: Path) -> str:
     if not text:
         return ""
 
-    prompt = f"""
-Summarize the text below in:
-- 3 concise bullet points
-- then 3 short tags (single words or short phrases)
-
-Text:
-{text}
-""".strip()
+    prompt = SUMMARY_PROMPT.format(text=text)
 
-    resp = client.responses.create(
+    resp = await client.responses.create(
         model="gpt-4.1-mini",
         input=prompt,
         temperature=0.2,
@@ -224,39 +188,35 @@ Text:
 
     return resp.output_text.strip()
 
-def write_summary_sidecar(final_path: Path, summary: str):
+def write_summary_sidecar(final_path, summary: str):
     """Optional helper to save a summary next to the file as '<name>.summary.txt'."""
-    summary_path = final_path.with_suffix(final_path.suffix + ".summary.txt")
+    summary_path = Path(f"{os.fspath(final_path)}.summary.txt")
     summary_path.write_text(summary, encoding="utf-8")
     return summary_path
 
-def organize_file(path: Path):
-    """
-    Main "act" step:
-    - Only processes files that are directly inside WATCH_DIR (not nested folders).
-    - TXT: AI route (and optionally summarize).
-    - Other extensions: static extension-based routing.
-    """
-    ext = path.suffix.lower()
-
-    # Only act on files in the root of WATCH_DIR (prevents re-processing moved files).
-    if path.parent != WATCH_DIR:
-        return
-
-    # --- AI routing for TXT ---
-    if ext == ".txt":
-        # Avoid classifying/moving files still being written/locked.
-        if not wait_until_ready(path):
-            print(f"⚠️ TXT still busy/locked: {path.name} (will retry)")
-            log_event("busy_retry", path)
-            retry_later(path, 1.0)
-            return
+class AgentWatcher(Watcher):
+    """Routes TXT files with ai_route_txt (and optionally summarizes them); other files by extension."""
+    def handle_ready(self, path: Path, folder_name: str):
+        # --- extension routing for everything else ---
+        if path.suffix.lower() != ".txt":
+            return super().handle_ready(path, folder_name)
 
-        folder_name = ai_route_txt(path)
-        dest_dir = WATCH_DIR / folder_name
-        new_path = move_safely(path, dest_dir)
+        # --- AI routing for TXT ---
+        # Runs on the OpenAI loop so N pending TXTs overlap their round-trips.
+        asyncio.run_coroutine_threadsafe(self.route_txt(path), loop)
 
-        print(f"🧠 AI Routed TXT → {folder_name}/")
+    async def route_txt(self, path: Path):
+        """AI-route one ready TXT file, then optionally summarize it."""
+        try:
+            folder_name = await ai_route_txt(path)
+            new_path = move_safely(path, os.path.join(self.watch_dir_str, folder_name))
+        except Exception as e:
+            # No observer thread to fall back on here; report like on_trigger does.
+            logger.error("❌ Action failed for %s: %s", path, e)
+            log_event("action_error", path)
+            return
+
+        logger.info("🧠 AI Routed TXT → %s/", folder_name)
         log_event("ai_routed_txt", new_path)
 
         # --- optional summarization ---
@@ -266,7 +226,7 @@ def organize_file(path: Path):
         if do_summary:
             try:
                 # Summarize after moving so the summary attaches to the final path.
-                summary = ai_summarize_txt(new_path)
+                summary = await ai_summarize_txt(new_path)
                 log_event("ai_summary_txt", new_path, summary=summary)
 
                 # Optional: write summary to a sidecar file (commented out by default).
@@ -276,89 +236,13 @@ def organize_file(path: Path):
             except Exception as e:
                 log_event("summary_error", new_path, error=str(e))
 
-        return
-
-    # --- extension routing for everything else ---
-    folder_name = ORGANIZE_MAP.get(ext)
-    if not folder_name:
-        return
-
-    if not wait_until_ready(path):
-        print(f"⚠️ File still busy/locked: {path.name} (will retry)")
-        log_event("busy_retry", path)
-        retry_later(path, 1.0)
-        return
-
-    dest_dir = WATCH_DIR / folder_name
-    new_path = move_safely(path, dest_dir)
-
-    print(f"📂 Moved {path.name} → {folder_name}/")
-    log_event("organized", new_path)
-
-def on_trigger(event_type: str, path: Path):
-    """
-    Debounced entrypoint called by watchdog events.
-    Only triggers actions for a subset of event types.
-    """
-    now = time.time()
-    last_time = last_handled.get(path)
-
-    # Coalesce rapid repeats for the same path (common with editor saves/downloads).
-    if last_time and (now - last_time) < DEBOUNCE_SECONDS:
-        return
-
-    last_handled[path] = now
-    log_event(event_type, path)
-
-    try:
-        if event_type in {"created", "moved", "retry"}:
-            organize_file(path)
-    except Exception as e:
-        # Protect the observer thread from crashing on unexpected exceptions.
-        print(f"❌ Action failed for {path}: {e}")
-        log_event("action_error", path)
-
-class Handler(FileSystemEventHandler):
-    """Watchdog handler that converts filesystem events into our on_trigger() calls."""
-    def on_created(self, event):
-        p = Path(event.src_path)
-        if should_watch(p):
-            on_trigger("created", p)
-
-    def on_modified(self, event):
-        p = Path(event.src_path)
-        if should_watch(p):
-            on_trigger("modified", p)
-
-    def on_moved(self, event):
-        p = Path(event.dest_path)
-        if should_watch(p):
-            on_trigger("moved", p)
-
-    def on_deleted(self, event):
-        p = Path(event.src_path)
-        if should_watch(p):
-            on_trigger("deleted", p)
+    def run(self):
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        super().run()
 
 def main():
-    """Bootstraps the watchdog observer and keeps the process alive until Ctrl+C."""
-    if not WATCH_DIR.exists():
-        raise FileNotFoundError(f"WATCH_DIR does not exist: {WATCH_DIR}")
-
-    observer = Observer()
-    observer.schedule(Handler(), str(WATCH_DIR), recursive=True)
-    observer.start()
-
-    print(f"Watching: {WATCH_DIR} (recursive=True)")
-    print("Press Ctrl+C to stop.")
-
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        observer.stop()
-
-    observer.join()
+    """Bootstraps the watcher and keeps the process alive until Ctrl+C."""
+    AgentWatcher(WATCH_DIR).run()
 
 if __name__ == "__main__":
     main()
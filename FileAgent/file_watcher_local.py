@@ -1,23 +1,35 @@
 import time                 
-import json                 
 from pathlib import Path    
-from watchdog.observers import Observer                     
-from watchdog.events import FileSystemEventHandler          
-import shutil            
 import threading            
-from transformers import pipeline                           
+import os
+import queue
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+# Debounce, readiness checks, moves, retries and the JSONL log are shared with the other scripts
+from _core import Watcher, log_event, logger, move_safely, read_text_preview
 
 
 # Folder you watch for new/changed files (root "inbox" folder you drop things into)
 WATCH_DIR = Path(r"C:\Users\danie\Documents\filetest")
 
-# JSONL log file (one JSON object per line) stored next to this script
-LOG_FILE = Path(__file__).with_name("file_watcher_log.jsonl")
-
-WATCH_EXTENSIONS = {".txt", ".md", ".csv", ".log", ".pdf"}  # None to watch all
+# Small batches on CPU run best on a few threads; more just fight over caches.
+# At most 4 by default, fewer on 1-3 core machines (ROUTE_THREADS overrides).
+# Set before the model loads (interop threads can't be changed once work has started).
+torch.set_num_threads(int(os.environ.get("ROUTE_THREADS", 0)) or min(4, os.cpu_count() or 1))
+torch.set_num_interop_threads(1)
 
 # This model can "choose" among candidate labels without you training it.
-classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
+MODEL_NAME = "facebook/bart-large-mnli"
+tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME).eval()
+
+# int8 dynamic quantization of every Linear layer (CPU inference):
+# ~4x smaller weights than fp32 and noticeably faster matmuls
+model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+# Index of the "entailment" logit (the NLI head also scores neutral/contradiction)
+ENTAILMENT_ID = next(i for label, i in model.config.label2id.items() if label.lower().startswith("entail"))
 
 # Folder -> list of short descriptions (candidates) that represent that folder.
 TXT_LABELS = {
@@ -28,6 +40,36 @@ TXT_LABELS = {
     "Other": ["miscellaneous note"]
 }
 
+# Flatten candidate labels into one list of short descriptions (what the model ranks).
+# These never change at runtime, so build them once instead of per file.
+CANDIDATES = []
+LABEL_TO_FOLDER = {}  # maps each description -> its folder
+for _folder, _descs in TXT_LABELS.items():
+    for _d in _descs:
+        CANDIDATES.append(_d)
+        LABEL_TO_FOLDER[_d] = _folder
+
+# Same hypothesis wording the zero-shot pipeline uses by default.
+# Tokenized once here (no special tokens); only the file's text gets tokenized per call.
+HYPOTHESES = [f"This example is {c}." for c in CANDIDATES]
+HYPOTHESIS_IDS = [tokenizer(h, add_special_tokens=False)["input_ids"] for h in HYPOTHESES]
+
+# Token budget for the file text: what's left after the longest hypothesis + <s> ... </s></s> ... </s>
+PREMISE_MAX_TOKENS = (
+    tokenizer.model_max_length
+    - max(map(len, HYPOTHESIS_IDS))
+    - tokenizer.num_special_tokens_to_add(pair=True)
+)
+
+# TXT files are routed in small batches: collect for TXT_BATCH_WINDOW seconds
+# (up to TXT_BATCH_MAX files) and classify them in one zero_shot call
+TXT_BATCH_WINDOW = 0.2
+TXT_BATCH_MAX = 8
+
+# Most (text, hypothesis) sequences per forward pass. A full batch is 8 files x 19 hypotheses,
+# up to ~1000 tokens each; that many at once in BART-large can run a desktop out of memory
+ZERO_SHOT_MAX_SEQS = 24
+
 
 
 TXT_AI_FOLDERS = {
@@ -40,338 +82,167 @@ TXT_AI_FOLDERS = {
 }
 
 
-# Simple extension-based routing for non-.txt files 
-ORGANIZE_MAP = {
-    ".pdf": "PDFs",
-    ".txt": "Docs",
-    ".md": "Docs",
-    ".csv": "Data",
-    ".log": "Logs",
-}
+# Keyword lists for the manual classifier, in priority order (first label with a hit wins)
+TXT_KEYWORDS = {
+    # School-ish keywords
+    "school": ["canvas", "assignment", "midterm", "lecture", "homework", "osu", "cse", "ece"],
 
-# Debounce prevents the same file from being processed repeatedly in quick succession
-DEBOUNCE_SECONDS = 0.5
-last_handled = {}   # path -> last timestamp handled
+    # Work-ish keywords
+    "work": ["meeting", "jira", "ticket", "manager", "deadline", "sprint"],
 
+    # Receipt/finance-ish keywords
+    "receipt": ["$","total","subtotal","tax","invoice","order","payment","receipt"],
 
-def should_watch(path: Path) -> bool:
-    # Ignore folders; only process files
-    if path.is_dir():
-        return False
+    # Code-ish keywords (basic heuristics)
+    "code": ["def ", "class ", "import ", "{", "}", "function", "SELECT ", "FROM "],
+}
 
-    # If None, accept any file
-    if WATCH_EXTENSIONS is None:
-        return True
+# Flatten into (keyword, label) pairs, still in priority order.
+# Each `k in t` check runs as a C substring search inside CPython (memchr for "$", "{", "}"),
+# and we stop at the first hit, so the first label in priority order wins.
+KEYWORD_TABLE = tuple((k, label) for label, keywords in TXT_KEYWORDS.items() for k in keywords)
 
-    # Otherwise only accept listed extensions
-    return path.suffix.lower() in WATCH_EXTENSIONS
 
 #manual unused classification
 def classify_txt_light(text: str) -> str:
    
     t = text.lower()
-
-    # School-ish keywords
-    if any(k in t for k in ["canvas", "assignment", "midterm", "lecture", "homework", "osu", "cse", "ece"]):
-        return "school"
-
-    # Work-ish keywords
-    if any(k in t for k in ["meeting", "jira", "ticket", "manager", "deadline", "sprint"]):
-        return "work"
-
-    # Receipt/finance-ish keywords
-    if any(k in t for k in ["$","total","subtotal","tax","invoice","order","payment","receipt"]):
-        return "receipt"
-
-    # Code-ish keywords (basic heuristics)
-    if any(k in t for k in ["def ", "class ", "import ", "{", "}", "function", "SELECT ", "FROM "]):
-        return "code"
+    for k, label in KEYWORD_TABLE:
+        if k in t:
+            return label
 
     # Fallback category
     return "misc"
 
 
-def read_text_preview(path: Path, max_chars: int = 3000) -> str:
-    # Read a chunk safely (prevents huge files from being fully loaded)
-    # errors="ignore" avoids crashing 
-    try:
-        return path.read_text(encoding="utf-8", errors="ignore")[:max_chars]
-    except Exception:
-        # If file can't be read (locked, deleted, encoding issue), return empty string
-        return ""
+def zero_shot(texts: list) -> list:
 
+   # Zero-shot classification of several texts at once.
+   # The (text, hypothesis) pairs go through the model ZERO_SHOT_MAX_SEQS at a time,
+   # then each text's entailment logits are softmaxed across the candidates.
+   # Returns [(best description, score), ...] in the same order as texts.
 
-def ai_route_txt(path: Path) -> str:
-    
-   # Returns folder name like 'School', 'Work', etc.
-    #Uses an actual model to decide based on meaning.
-    
-    # Pull a short preview of the file so inference is fast
-    text = read_text_preview(path)
+    # Tokenize each text once, then pair it with every cached hypothesis
+    premise_ids = tokenizer(
+        texts, add_special_tokens=False, truncation=True, max_length=PREMISE_MAX_TOKENS
+    )["input_ids"]
+    pairs = [
+        {"input_ids": tokenizer.build_inputs_with_special_tokens(p, h)}
+        for p in premise_ids
+        for h in HYPOTHESIS_IDS
+    ]
 
-    # If empty/whitespace-only, treat as uncategorizable
-    if not text.strip():
-        return "Other"
-
-    # Flatten candidate labels into one list of short descriptions (what the model ranks)
-    candidates = []
-    label_to_folder = {}  # maps each description -> its folder
-    for folder, descs in TXT_LABELS.items():
-        for d in descs:
-            candidates.append(d)
-            label_to_folder[d] = folder
+    # Each slice is padded only to its own longest pair (a slice spans at most two texts),
+    # so a short file batched with a long one isn't padded out to the long one's length.
+    # inference_mode: like no_grad, but also skips autograd's version-counter bookkeeping
+    entail = []
+    with torch.inference_mode():
+        for i in range(0, len(pairs), ZERO_SHOT_MAX_SEQS):
+            inputs = tokenizer.pad(pairs[i:i + ZERO_SHOT_MAX_SEQS], return_tensors="pt")
+            entail.append(model(**inputs).logits[:, ENTAILMENT_ID])
 
-    # Run zero-shot: returns ranked labels + scores
-    result = classifier(text, candidates)
+    # One row per text, one column per candidate
+    entail = torch.cat(entail).view(len(texts), len(CANDIDATES))
+    scores = entail.softmax(dim=-1)
+    best = scores.argmax(dim=-1).tolist()
 
-    # Top predicted "description"
-    best_desc = result["labels"][0]
+    return [(CANDIDATES[j], float(scores[i, j])) for i, j in enumerate(best)]
 
-    # Convert that description back into your folder name
-    folder = label_to_folder[best_desc]
 
-    # Optional confidence threshold: if model isn't confident, dump into Other
-    score = float(result["scores"][0])
-    if score < 0.45:
-        return "Other"
+def ai_route_txts(paths: list) -> list:
 
-    return folder
+   # Returns one folder name per path, like 'School', 'Work', etc.
+   # Uses an actual model to decide based on meaning.
 
+    # Pull a short preview of each file so inference is fast
+    texts = [read_text_preview(p, max_chars=3000) for p in paths]
 
-def retry_later(path: Path, seconds: float = 1.0):
-    
-  #  If a file is locked/busy (common on Windows right after creation/download),
-   # this schedules a background retry after a delay.
-    
-    def _job():
-        time.sleep(seconds)
-        if path.exists():  # still there (wasn't deleted)
-            on_trigger("retry", path)
-
-    # Daemon thread so it won't prevent the program from exiting
-    threading.Thread(target=_job, daemon=True).start()
+    # If empty/whitespace-only, treat as uncategorizable
+    folders = ["Other"] * len(paths)
+    todo = [i for i, t in enumerate(texts) if t.strip()]
+    if not todo:
+        return folders
 
+    # Run zero-shot on every non-empty text in one batch
+    for i, (best_desc, score) in zip(todo, zero_shot([texts[i] for i in todo])):
+        # Optional confidence threshold: if model isn't confident, dump into Other
+        if score >= 0.45:
+            # Convert that description back into your folder name
+            folders[i] = LABEL_TO_FOLDER[best_desc]
 
-def log_event(event_type: str, path: Path):
-    
-   # Append an event record to the JSONL log file and print it.
-   # JSONL is great because you can stream/grep/parse it later.
-    
-    record = {
-        "ts": time.strftime("%Y-%m-%d %H:%M:%S"),  # human-readable timestamp
-        "event": event_type,                       # created/modified/moved/deleted/retry/etc
-        "path": str(path),                         # file path string
-    }
+    return folders
 
-    # Ensure log directory exists
-    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-    # Append a single JSON object per line
-    with LOG_FILE.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(record) + "\n")
-
-    # Also print for realtime visibility
-    print(record)
+def ai_route_txt(path: Path) -> str:
+    # Single-file version of ai_route_txts
+    return ai_route_txts([path])[0]
 
 
-def wait_until_ready(path: Path, attempts: int = 20, delay: float = 0.25) -> bool:
+class LocalWatcher(Watcher):
     
-   # Tries to avoid WinError 32 by waiting until the file is readable and stable.
-
-  #  Strategy:
-   # 1) Try opening file for read (detects locks).
-   # 2) Wait until file size stops changing (helps with downloads/copies).
+   # Routes .txt files with the local model (via txt_queue / txt_worker);
+   # everything else goes through the shared extension routing.
     
-    last_size = -1
-
-    for _ in range(attempts):
-        # If file disappeared, nothing to do
-        if not path.exists():
-            return False
-
-        try:
-            # 1) Try opening for read to detect locks
-            with path.open("rb"):
-                pass
+    def __init__(self, watch_dir: Path):
+        super().__init__(watch_dir)
+        self.txt_queue = queue.Queue()   # paths that are ready and waiting for ai routing
 
-            # 2) Check size stability (download/copy completion heuristic)
-            size = path.stat().st_size
-            if size == last_size:
-                return True
-            last_size = size
+    def handle_ready(self, path: Path, folder_name: str):
+        if path.suffix.lower() != ".txt":
+            # extension routing for everything else
+            return super().handle_ready(path, folder_name)
 
-        except PermissionError:
-            # Still locked by another process
-            pass
+        # Hand off to txt_worker, which batches model calls and moves the file
+        self.txt_queue.put(path)
 
-        time.sleep(delay)
+    def txt_worker(self):
 
-    # Gave up waiting
-    return False
-
-
-def move_safely(src: Path, dest_dir: Path) -> Path:
-    
-  #  Move src into dest_dir.
-  #  If a file with same name already exists, auto-rename with (1), (2), etc.
-    
-    dest_dir.mkdir(parents=True, exist_ok=True)
-    dest = dest_dir / src.name
+       # Drains self.txt_queue: waits for one ready TXT, then keeps collecting for
+       # TXT_BATCH_WINDOW seconds so a burst of files shares one model call.
+       # This is the watcher's only thread that runs the model, so its inferences never overlap.
 
-    # Auto-rename if name exists
-    if dest.exists():
-        stem, suf = src.stem, src.suffix
-        i = 1
         while True:
-            candidate = dest_dir / f"{stem} ({i}){suf}"
-            if not candidate.exists():
-                dest = candidate
-                break
-            i += 1
-
-    # shutil.move handles cross-volume moves too
-    shutil.move(str(src), str(dest))
-    return dest
-
-
-def organize_file(path: Path):
-    
-  #  Main routing logic.
-  #  - Only organizes files placed directly in WATCH_DIR (root).
-  #  - .txt gets AI-based routing (ai_route_txt)
-  #  - Other extensions use ORGANIZE_MAP
-    
-    ext = path.suffix.lower()
-
-    # only act on files in the root of WATCH_DIR
-    # (prevents re-processing files after they’ve been moved into subfolders)
-    if path.parent != WATCH_DIR:
-        return
-
-    # AI routing for TXT
-    if ext == ".txt":
-        # Wait for Windows to release the lock / finish writing
-        if not wait_until_ready(path):
-            print(f"⚠️ TXT still busy/locked: {path.name} (will retry)")
-            log_event("busy_retry", path)
-            retry_later(path, 1.0)
-            return
-
-        # Ask the model which folder to route to
-        folder_name = ai_route_txt(path)      # real model decision
-        dest_dir = WATCH_DIR / folder_name
-
-        # Move with collision-safe naming
-        new_path = move_safely(path, dest_dir)
-
-        print(f"🧠 AI Routed TXT → {folder_name}/")
-        log_event("ai_routed_txt", new_path)
-        return
-
-    # extension routing for everything else
-    folder_name = ORGANIZE_MAP.get(ext)
-    if not folder_name:
-        # Unknown extension (or not mapped) -> do nothing
-        return
-
-    # Wait until the file can be safely moved
-    if not wait_until_ready(path):
-        print(f"⚠️ File still busy/locked: {path.name} (will retry)")
-        log_event("busy_retry", path)
-        retry_later(path, 1.0)
-        return
-
-    # Move into mapped folder
-    dest_dir = WATCH_DIR / folder_name
-    new_path = move_safely(path, dest_dir)
-    print(f"📂 Moved {path.name} → {folder_name}/")
-    log_event("organized", new_path)
-
-
-def on_trigger(event_type: str, path: Path):
-    
-   # Central event gate:
-   # - Debounces rapid repeat events for the same path
-   # - Logs the event
-   # - Runs organize_file only for created/moved/retry events
-    
-    now = time.time()
-    last_time = last_handled.get(path)
-
-    # Debounce: ignore duplicate events within the window
-    if last_time and (now - last_time) < DEBOUNCE_SECONDS:
-        return
-
-    last_handled[path] = now
-    log_event(event_type, path)
-
-    try:
-        # Only organize on these event types (modified/deleted get logged but not moved)
-        if event_type in {"created", "moved", "retry"}:
-            organize_file(path)
-    except Exception as e:
-        # Never kill the watcher thread — swallow exceptions and log them
-        print(f"❌ Action failed for {path}: {e}")
-        log_event("action_error", path)
-
-
-class Handler(FileSystemEventHandler):
-    
-   # Watchdog event handler.
-   # Each method is called by watchdog when the OS reports a filesystem event.
-    
-
-    def on_created(self, event):
-        # New file appeared at event.src_path
-        p = Path(event.src_path)
-        if should_watch(p):
-            on_trigger("created", p)
-
-    def on_modified(self, event):
-        # File content changed (often fires multiple times as something writes)
-        p = Path(event.src_path)
-        if should_watch(p):
-            on_trigger("modified", p)
-
-    def on_moved(self, event):
-        # File was renamed or moved (destination path is event.dest_path)
-        p = Path(event.dest_path)
-        if should_watch(p):
-            on_trigger("moved", p)
-
-    def on_deleted(self, event):
-        # File was deleted (only src_path exists in the event)
-        p = Path(event.src_path)
-        if should_watch(p):
-            on_trigger("deleted", p)
+            batch = [self.txt_queue.get()]
+            deadline = time.monotonic() + TXT_BATCH_WINDOW
+            while len(batch) < TXT_BATCH_MAX:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.txt_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                folders = ai_route_txts(batch)
+            except Exception as e:
+                logger.error("❌ TXT routing failed for %d file(s): %s", len(batch), e)
+                for path in batch:
+                    log_event("action_error", path)
+                continue
+
+            for path, folder_name in zip(batch, folders):
+                try:
+                    # Move with collision-safe naming
+                    new_path = move_safely(path, os.path.join(self.watch_dir_str, folder_name))
+                except Exception as e:
+                    # File vanished or got locked again while queued
+                    logger.error("❌ Action failed for %s: %s", path, e)
+                    log_event("action_error", path)
+                    continue
+
+                logger.info("🧠 AI Routed TXT → %s/", folder_name)
+                log_event("ai_routed_txt", new_path)
+
+    def run(self):
+        # Daemon thread so it won't prevent the program from exiting
+        threading.Thread(target=self.txt_worker, daemon=True).start()
+        super().run()
 
 
 def main():
-    # Fail fast if the target directory doesn't exist
-    if not WATCH_DIR.exists():
-        raise FileNotFoundError(f"WATCH_DIR does not exist: {WATCH_DIR}")
-
-    # Observer is the engine that monitors changes and calls Handler()
-    observer = Observer()
-
-    # recursive=True watches subfolders too,
-    # but organize_file only processes files in WATCH_DIR root (so moved files won't get reprocessed)
-    observer.schedule(Handler(), str(WATCH_DIR), recursive=True)
-    observer.start()
-
-    print(f"Watching: {WATCH_DIR} (recursive=True)")
-    print("Press Ctrl+C to stop.")
-
-    try:
-        # Keep the main thread alive so watchdog can keep running
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        # Stop cleanly on Ctrl+C
-        observer.stop()
-
-    # Wait for observer thread to finish
-    observer.join()
+    # Fails fast if WATCH_DIR doesn't exist, then watches until Ctrl+C
+    LocalWatcher(WATCH_DIR).run()
 
 
 if __name__ == "__main__":